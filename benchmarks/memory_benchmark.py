@@ -0,0 +1,70 @@
+"""Reports the memory used by the spectrum map pipeline.
+    
+Run from a directory containing a spectrum folder of
+downloaded spectrum json files, or pass --download:
+    
+    python benchmarks/memory_benchmark.py --low-memory --search LTE
+    
+"""
+
+__author__ = "David Northcote"
+__organisation__ = "The Univeristy of Strathclyde"
+__support__ = "https://github.com/strath-sdr/pynq_spectrum_map"
+
+import argparse
+import time
+
+from pynq_specmap import application
+from pynq_specmap import download
+from pynq_specmap import search
+from pynq_specmap import utilities
+
+
+def report(stage, start, bands=None):
+    """Prints the elapsed time, the peak resident
+    set size, and the size of the bands object.
+    
+    """
+    columns = [stage.ljust(24),
+               '{:8.2f} s'.format(time.perf_counter() - start),
+               '{:10.1f} MB peak RSS'.format(utilities.get_peak_rss()/1e6)]
+    if bands is not None:
+        columns.append('{:10.1f} MB bands'.format(
+            utilities.get_bands_memory_usage(bands)/1e6))
+    print(' '.join(columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filename', default='')
+    parser.add_argument('--region', default='')
+    parser.add_argument('--download', action='store_true')
+    parser.add_argument('--low-memory', action='store_true')
+    parser.add_argument('--memory-budget', type=int, default=None)
+    parser.add_argument('--cache', action='store_true')
+    parser.add_argument('--search', default='')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report('start', start)
+    if args.download:
+        download.download_bands()
+        report('download_bands', start)
+    bands = download.refresh_bands_object(filename=args.filename,
+                                          region=args.region,
+                                          low_memory=args.low_memory,
+                                          memory_budget=args.memory_budget,
+                                          cache=args.cache)
+    report('refresh_bands_object', start, bands)
+    application.spectrum_map_tool(bands,
+                                  low_memory=args.low_memory,
+                                  memory_budget=args.memory_budget)
+    report('spectrum_map_tool', start, bands)
+    if args.search:
+        search_index = search.initialise_search_index(bands)
+        matches = search.search_bands(search_index, args.search)
+        report(''.join(['search (', str(len(matches)), ' bands)']), start, bands)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,20 +15,38 @@ about = ''.join(['<br><b>', __info__, '</b><br>',
                 '<br><br>', '<b>Support</b>:<br>', __support__])
 
 import ipywidgets as ipw
+import numpy as np
 import os
 import plotly.graph_objs as go
 
 from pynq_specmap import filters
 from pynq_specmap import plots
+from pynq_specmap import search
+from pynq_specmap import utilities
 
 
 select_dict = {}
 
 
-def spectrum_map_tool(bands, merge=True, threshold=0, unique=False, template='plotly'):
+def spectrum_map_tool(bands, merge=True, threshold=0, unique=False, template='plotly',
+                      low_memory=False, memory_budget=None, plot_callback=None):
     """Returns the spectrum mapping tool
     application.
     
+    Use the low_memory argument to merge bands
+    without deep copying the bands dataframe, and to
+    read the band selector values from the bands
+    dataframe instead of copying them into lists. Use
+    the memory_budget argument to raise a MemoryError if
+    the bands, merged bands, band selector values, and
+    search index use more than the given number of
+    bytes. The search index is only built once the
+    search box is used. Use
+    the plot_callback argument to pass a function
+    that is called with the plot and bands once the
+    plot is built, for example to attach a spectrum
+    overlay using sensing.initialise_spectrum_overlay.
+    
     """
     
     def on_value_change_sector(change):
@@ -46,19 +64,7 @@ def spectrum_map_tool(bands, merge=True, threshold=0, unique=False, template='pl
         plot.data = traces_reference
         filtered_bands_merged = filters.filter_bands(bands_merged, s=[sector])
         plot.layout.xaxis.range = (0, 4096e6)
-        band_select.unobserve(on_click_band, names='index')
-        u_range, u_name = [], []
-        for index in range(len(select_dict[sector]['u'])):
-            u = select_dict[sector]['u'][index]
-            u_strings = u.split(' — ')
-            u_range.append(u_strings[0])
-            u_name.append(u_strings[1])
-        band_select.options = u_name
-        band_select_alt.options = u_range
-        band_select.value = None
-        band_select.rows = len(select_dict[sector]['u'])
-        band_select_alt.rows = len(select_dict[sector]['u'])
-        band_select.observe(on_click_band, names='index')
+        set_band_options(sector, search_text.value)
         traces = filtered_bands_merged.trace.tolist()
         plots.batch_add_traces(plot, traces)
         plots.add_overlay_trace(plot)
@@ -72,25 +78,89 @@ def spectrum_map_tool(bands, merge=True, threshold=0, unique=False, template='pl
         sector = sector_dropdown.value
         index = change['owner'].index
         if index is not None:
-            u = select_dict[sector]['u'][index]
+            index = band_positions[index]
+            u = get_select_value(sector, 'u', index)
             u_range, u_name = u.split(' — ')
             band_to_display = bands_merged[
                 bands_merged['u'].str.contains(u, na=False, regex=False)]
             if len(band_to_display) != 1:
                 raise RuntimeError(''.join(['Could not display band ', u]))
             if not merge:
-                lf = select_dict[sector]['lf'][index]
-                uf = select_dict[sector]['uf'][index]
-                bw = select_dict[sector]['bw'][index]
+                lf = get_select_value(sector, 'lf', index)
+                uf = get_select_value(sector, 'uf', index)
+                bw = get_select_value(sector, 'bw', index)
             else:
                 lf = band_to_display['lf'].tolist()[0]
                 uf = band_to_display['uf'].tolist()[0]
                 bw = band_to_display['bandwidth'].tolist()[0]
-            plots.update_overlay_trace(plot=plot, s=sector, u=select_dict[sector]['u'][index],
-                                       lf=select_dict[sector]['lf'][index],
-                                       uf=select_dict[sector]['uf'][index])
+            plots.update_overlay_trace(plot=plot, s=sector, u=get_select_value(sector, 'u', index),
+                                       lf=get_select_value(sector, 'lf', index),
+                                       uf=get_select_value(sector, 'uf', index))
             plot.layout.xaxis.range = (lf-bw*2, uf+bw*2)
             
+    def on_search_change(change):
+        """Callback for the band search text
+        widget.
+        
+        """
+        set_band_options(sector_dropdown.value, change['new'])
+        
+    def set_band_options(sector, query=''):
+        """Sets the band selector options to the
+        bands in the sector matching the search query.
+        
+        """
+        positions = range(get_select_length(sector))
+        if query.strip():
+            matches = set(search.search_bands(get_search_index(), query))
+            positions = [index for index in positions
+                         if get_select_value(sector, 'index', index) in matches]
+        band_positions[:] = positions
+        band_select.unobserve(on_click_band, names='index')
+        u_range, u_name = [], []
+        for index in band_positions:
+            u = get_select_value(sector, 'u', index)
+            u_strings = u.split(' — ')
+            u_range.append(u_strings[0])
+            u_name.append(u_strings[1])
+        band_select.options = u_name
+        band_select_alt.options = u_range
+        band_select.value = None
+        band_select.rows = len(band_positions)
+        band_select_alt.rows = len(band_positions)
+        band_select.observe(on_click_band, names='index')
+        
+    def get_select_value(sector, key, index):
+        """Returns the value of the key column for
+        the band at the given position in the sector.
+        
+        """
+        if low_memory:
+            return band_columns[key][select_dict[sector]['positions'][index]]
+        return select_dict[sector][key][index]
+        
+    def get_select_length(sector):
+        """Returns the number of bands in the
+        sector.
+        
+        """
+        if low_memory:
+            return len(select_dict[sector]['positions'])
+        return len(select_dict[sector]['u'])
+        
+    def get_search_index():
+        """Returns the search index over the bands,
+        building it the first time it is needed.
+        
+        """
+        if search_state['index'] is None:
+            search_index = search.initialise_search_index(bands)
+            if memory_budget is not None:
+                search_state['memory_usage'] += utilities.get_object_size(search_index)
+                utilities.check_memory_budget(search_state['memory_usage'], memory_budget)
+            search_state['index'] = search_index
+        return search_state['index']
+        
     def on_button_click(change):
         """Callback for the reset button
         widget.
@@ -105,44 +175,74 @@ def spectrum_map_tool(bands, merge=True, threshold=0, unique=False, template='pl
     global select_dict
     plot = plots.initialise_plot(template=template)
     sectors = filters.get_bands_unique_values(bands, key='s')['s']
-    for sector in sectors:
-        sector_bands = filters.filter_bands(bands, s=[sector])
-        select_dict[sector] = {
-            'u' : sector_bands.u.tolist(),
-            'lf' : sector_bands.lf.tolist(),
-            'uf' : sector_bands.uf.tolist(),
-            'bw' : sector_bands.bandwidth.tolist()
+    if low_memory:
+        band_columns = {
+            'u' : bands['u'].to_numpy(),
+            'lf' : bands['lf'].to_numpy(),
+            'uf' : bands['uf'].to_numpy(),
+            'bw' : bands['bandwidth'].to_numpy(),
+            'index' : bands.index
         }
-    bands_merged = filters.merge_bands_threshold(bands, threshold, unique)
+    for sector in sectors:
+        if low_memory:
+            select_dict[sector] = {
+                'positions' : np.flatnonzero(bands['s'].values == sector)
+            }
+        else:
+            sector_bands = filters.filter_bands(bands, s=[sector])
+            select_dict[sector] = {
+                'u' : sector_bands.u.tolist(),
+                'lf' : sector_bands.lf.tolist(),
+                'uf' : sector_bands.uf.tolist(),
+                'bw' : sector_bands.bandwidth.tolist(),
+                'index' : sector_bands.index.tolist()
+            }
+    search_state = {'index' : None, 'memory_usage' : 0}
+    band_positions = list(range(get_select_length(sectors[0])))
+    bands_merged = filters.merge_bands_threshold(bands, threshold, unique, low_memory)
+    if memory_budget is not None:
+        seen = set()
+        search_state['memory_usage'] = \
+            utilities.get_bands_memory_usage(bands, seen) + \
+            utilities.get_bands_memory_usage(bands_merged, seen) + \
+            utilities.get_object_size([select_dict[sector] for sector in sectors], seen)
+        del seen
+        utilities.check_memory_budget(search_state['memory_usage'], memory_budget)
     filtered_bands_merged = filters.filter_bands(bands_merged, s=[sectors[0]])
     traces = filtered_bands_merged.trace.tolist()
     plots.batch_add_traces(plot, traces)
     plots.add_overlay_trace(plot)
-    plots.update_overlay_trace(plot=plot, s=sectors[0], u=select_dict[sectors[0]]['u'][0],
-                               lf=select_dict[sectors[0]]['lf'][0],
-                               uf=select_dict[sectors[0]]['uf'][0])
+    plots.update_overlay_trace(plot=plot, s=sectors[0], u=get_select_value(sectors[0], 'u', 0),
+                               lf=get_select_value(sectors[0], 'lf', 0),
+                               uf=get_select_value(sectors[0], 'uf', 0))
+    if plot_callback is not None:
+        plot_callback(plot, bands)
     sector_dropdown = ipw.Dropdown(options=sectors,
                                    index=0,
                                    layout={'width' : 'auto'})
     u_range, u_name = [], []
-    for index in range(len(select_dict[sectors[0]]['u'])):
-        u = select_dict[sectors[0]]['u'][index]
+    for index in range(get_select_length(sectors[0])):
+        u = get_select_value(sectors[0], 'u', index)
         u_strings = u.split(' — ')
         u_range.append(u_strings[0])
         u_name.append(u_strings[1])
     band_select = ipw.Select(options=u_name,
                              value=None,
-                             rows=len(select_dict[sectors[0]]['u']),
+                             rows=get_select_length(sectors[0]),
                              layout={'width' : 'auto'})
     band_select_alt = ipw.Select(options=u_range,
                              value=None,
-                             rows=len(select_dict[sectors[0]]['u']),
+                             rows=get_select_length(sectors[0]),
                              layout={'width' : 'auto'})
     ipw.link((band_select, 'index'), (band_select_alt, 'index'))
     reset_button = ipw.Button(description='Reset Band Selection')
+    search_text = ipw.Text(value='',
+                           placeholder='Search bands',
+                           continuous_update=True,
+                           layout={'width' : 'auto'})
     sector_accordion = ipw.Accordion(children=[sector_dropdown],
                                      layout={'width' : 'auto'})
-    band_accordion = ipw.Accordion(children=[ipw.VBox([reset_button,
+    band_accordion = ipw.Accordion(children=[ipw.VBox([reset_button, search_text,
                                                        ipw.HBox([band_select_alt, band_select],
                                                                 layout={'height' : '300px'})])],
                                    layout={'width' : 'auto'})
@@ -150,6 +250,7 @@ def spectrum_map_tool(bands, merge=True, threshold=0, unique=False, template='pl
     band_accordion.set_title(0, 'Spectrum Bands')
     sector_dropdown.observe(on_value_change_sector, names='value')
     band_select.observe(on_click_band, names='index')
+    search_text.observe(on_search_change, names='value')
     reset_button.on_click(on_button_click)
     this_dir = os.path.dirname(__file__)
     if template == 'plotly_dark':
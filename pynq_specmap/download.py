@@ -9,13 +9,23 @@ import pathlib
 import os
 import time
 import pickle
+import hashlib
+import inspect
+import shutil
+import functools
+import marshal
+import sys
+import sysconfig
+import numpy as np
 import pandas as pd
+import plotly
 
 from pynq_specmap import plots
 from pynq_specmap import utilities
 
 
 SPECTRUM_UK_URL = "http://static.ofcom.org.uk/static/spectrum/data/spectrumMapping.json"
+CACHE_SIZE = 128*1024*1024
 
 
 def download_bands(url='', region='uk'):
@@ -64,12 +74,32 @@ def get_bands_filename(region='', date=None, time=None):
     return sorted(spectrum_filenames)
 
 
-def refresh_bands_object(filename='', region='', filter_callback=None):
+def refresh_bands_object(filename='', region='', filter_callback=None, \
+                         low_memory=False, memory_budget=None, \
+                         cache=True, cache_size=CACHE_SIZE, filter_spec=None):
     """Refreshes the spectrum map object using
     a previously downloaded spectrum json file.
     The user can specify the exact json file using
     the filename argument.
     
+    Use the low_memory argument to store the sector
+    and v columns as categories and share trace data
+    between bands. Use the memory_budget argument to
+    raise a MemoryError as soon as the bands object uses
+    more than the given number of bytes, which is checked
+    after parsing and while the traces are built.
+    
+    Processed bands are cached in spectrum/cache using
+    the json file contents, the pynq_specmap source code,
+    and the filter_callback code together with the contents
+    of the global and closure variables it reads, so unchanged
+    inputs are not processed again. If the callback reads a
+    value that cannot be hashed reliably, the cache is not
+    used. Use the filter_spec argument to describe the filter
+    instead of the callback. Set cache to False to disable
+    caching. Use cache_size
+    to set the maximum size of the cache in bytes.
+    
     """
     spectrum_filenames = get_bands_filename(region)
     if filename == '':
@@ -79,19 +109,263 @@ def refresh_bands_object(filename='', region='', filter_callback=None):
             raise RuntimeError('No spectrum map files exist.')
     elif filename not in spectrum_filenames:
         raise ValueError(''.join(['File named ', filename, ' does not exist.']))
-    with open(''.join(['spectrum/',filename])) as json_file:
-        json_dict = json.load(json_file)
-        bands = pd.DataFrame(json_dict['bands'])
-    if filter_callback is not None:
-        bands = filter_callback(bands)
-    bands = add_fcutoff_unique_id(bands)
-    bands['bandwidth'] = bands.uf-bands.lf
-    bands = plots.initialise_traces_opt(bands)
-    bands.to_pickle('spectrum/bands.pkl')
+    with open(''.join(['spectrum/',filename]), 'rb') as json_file:
+        json_bytes = json_file.read()
+    if cache:
+        cache_filename = get_cache_filename(json_bytes, filter_callback,
+                                            filter_spec, low_memory)
+        cache = cache_filename is not None
+    if cache and os.path.isfile(cache_filename):
+        del json_bytes
+        bands = pd.read_pickle(cache_filename)
+        os.utime(cache_filename)
+        if memory_budget is not None:
+            utilities.check_memory_budget(
+                utilities.get_bands_memory_usage(bands), memory_budget)
+    else:
+        json_dict = json.loads(json_bytes)
+        del json_bytes
+        bands = pd.DataFrame(json_dict.pop('bands'))
+        del json_dict
+        if filter_callback is not None:
+            bands = filter_callback(bands)
+        if low_memory:
+            bands['s'] = bands['s'].astype('category')
+            bands['v'] = bands['v'].astype('category')
+        if memory_budget is not None:
+            utilities.check_memory_budget(
+                utilities.get_bands_memory_usage(bands), memory_budget)
+        bands = add_fcutoff_unique_id(bands)
+        bands['bandwidth'] = bands.uf-bands.lf
+        bands = plots.initialise_traces_opt(bands, low_memory, memory_budget)
+        if cache:
+            pathlib.Path('spectrum/cache').mkdir(parents=True, exist_ok=True)
+            bands.to_pickle(cache_filename)
+            evict_bands_cache(cache_size)
+    if cache and os.path.isfile(cache_filename):
+        shutil.copyfile(cache_filename, 'spectrum/bands.pkl')
+    else:
+        bands.to_pickle('spectrum/bands.pkl')
         
     return bands
 
 
+def is_library_object(value):
+    """Returns True if the given module, function,
+    or class belongs to pynq_specmap, the standard
+    library, or an installed package, rather than to
+    user code such as a notebook.
+    
+    """
+    module_name = value.__name__ if inspect.ismodule(value) \
+                  else getattr(value, '__module__', None)
+    if (not module_name) or (module_name == '__main__'):
+        return False
+    if module_name.split('.')[0] in ('pynq_specmap', 'builtins'):
+        return True
+    module_file = getattr(sys.modules.get(module_name), '__file__', None)
+    if module_file is None:
+        return module_name in sys.builtin_module_names
+    module_file = os.path.realpath(module_file)
+    library_paths = {os.path.realpath(sysconfig.get_paths()[name])
+                     for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')}
+    
+    return any(module_file.startswith(path) for path in library_paths)
+
+
+def get_library_fingerprint(value):
+    """Returns a string identifying a library
+    module, function, or class by its qualified
+    name and the version of its package.
+    
+    """
+    module_name = value.__name__ if inspect.ismodule(value) \
+                  else getattr(value, '__module__', '')
+    package = sys.modules.get(module_name.split('.')[0])
+    
+    return ''.join(['library:', module_name, ':',
+                    getattr(value, '__qualname__', ''), ':',
+                    str(getattr(package, '__version__', ''))])
+
+
+def get_function_fingerprint(value, visited):
+    """Returns a list of fingerprints identifying a
+    user function by its code, default arguments, and
+    the closure and global variables it reads, or None
+    if any of them cannot be fingerprinted.
+    
+    """
+    try:
+        code = inspect.getsource(value).encode()
+    except (OSError, TypeError):
+        code = marshal.dumps(value.__code__)
+    fingerprint = [hashlib.sha256(code).hexdigest(),
+                   get_value_fingerprint(value.__defaults__, visited),
+                   get_value_fingerprint(value.__kwdefaults__, visited)]
+    variables = inspect.getclosurevars(value)
+    references = dict(variables.globals, **variables.nonlocals)
+    for name in sorted(references):
+        fingerprint.append(name)
+        fingerprint.append(get_value_fingerprint(references[name], visited))
+    if None in fingerprint:
+        return None
+    
+    return fingerprint
+
+
+def get_value_fingerprint(value, visited=None):
+    """Returns a hash of the contents of a value
+    used by a filter callback, or None if the value
+    cannot be hashed reliably.
+    
+    Arrays and pandas objects are hashed by their data.
+    User functions are hashed by their code and the
+    variables they read, library functions and modules by
+    name and package version, and other values by their
+    pickled contents.
+    
+    """
+    if visited is None:
+        visited = set()
+    key = hashlib.sha256(type(value).__qualname__.encode())
+    try:
+        if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+            key.update(repr(value).encode())
+        elif isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            key.update(''.join([str(value.dtype), str(value.shape)]).encode())
+            key.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, (pd.Series, pd.DataFrame, pd.Index)):
+            key.update(repr(getattr(value, 'dtypes', value.dtype)).encode())
+            key.update(repr(list(getattr(value, 'columns', [value.name]))).encode())
+            key.update(pd.util.hash_pandas_object(value).values.tobytes())
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                fingerprint = get_value_fingerprint(item, visited)
+                if fingerprint is None:
+                    return None
+                key.update(fingerprint.encode())
+        elif isinstance(value, (set, frozenset, dict)):
+            items = value.items() if isinstance(value, dict) else value
+            fingerprints = [get_value_fingerprint(item, visited) for item in items]
+            if None in fingerprints:
+                return None
+            key.update(''.join(sorted(fingerprints)).encode())
+        elif isinstance(value, functools.partial):
+            fingerprint = get_value_fingerprint((value.func, value.args,
+                                                 value.keywords), visited)
+            if fingerprint is None:
+                return None
+            key.update(fingerprint.encode())
+        elif inspect.ismethod(value):
+            fingerprint = get_value_fingerprint((value.__func__, value.__self__), visited)
+            if fingerprint is None:
+                return None
+            key.update(fingerprint.encode())
+        elif (inspect.ismodule(value) or inspect.isroutine(value) or \
+              inspect.isclass(value)) and is_library_object(value) and \
+        (inspect.ismodule(getattr(value, '__self__', None)) or \
+         getattr(value, '__self__', None) is None):
+            key.update(get_library_fingerprint(value).encode())
+        elif inspect.ismodule(value):
+            return None
+        elif inspect.isfunction(value):
+            if id(value) in visited:
+                key.update(value.__qualname__.encode())
+            else:
+                visited.add(id(value))
+                fingerprint = get_function_fingerprint(value, visited)
+                if fingerprint is None:
+                    return None
+                key.update(''.join(fingerprint).encode())
+        elif inspect.isclass(value):
+            key.update(inspect.getsource(value).encode())
+        else:
+            if not is_library_object(type(value)):
+                key.update(inspect.getsource(type(value)).encode())
+            key.update(pickle.dumps(value, protocol=4))
+    except Exception:
+        return None
+    
+    return key.hexdigest()
+
+
+def get_pipeline_fingerprint():
+    """Returns a hash of the pynq_specmap source
+    files and the pandas and plotly versions, which
+    identifies the processing applied by
+    refresh_bands_object.
+    
+    """
+    key = hashlib.sha256(pd.__version__.encode())
+    key.update(plotly.__version__.encode())
+    package_dir = os.path.dirname(__file__)
+    for filename in sorted(os.listdir(package_dir)):
+        if filename.endswith('.py'):
+            with open(os.path.join(package_dir, filename), 'rb') as source_file:
+                key.update(filename.encode())
+                key.update(source_file.read())
+    
+    return key.hexdigest()
+
+
+def get_filter_fingerprint(filter_callback=None, filter_spec=None):
+    """Returns a string identifying the filtering
+    performed by refresh_bands_object, or None if it
+    cannot be identified reliably. The filter_spec
+    argument is used if given, otherwise the
+    filter_callback is fingerprinted.
+    
+    """
+    if filter_spec is not None:
+        fingerprint = get_value_fingerprint(filter_spec)
+        return None if fingerprint is None else ''.join(['spec:', fingerprint])
+    if filter_callback is None:
+        return ''
+    fingerprint = get_value_fingerprint(filter_callback)
+    
+    return None if fingerprint is None else ''.join(['callback:', fingerprint])
+
+
+def get_cache_filename(json_bytes, filter_callback=None, \
+                       filter_spec=None, low_memory=False):
+    """Returns the path of the cached bands object
+    for the given json file contents, filtering, and
+    version of the processing pipeline, or None if the
+    filtering cannot be identified reliably.
+    
+    """
+    filter_fingerprint = get_filter_fingerprint(filter_callback, filter_spec)
+    if filter_fingerprint is None:
+        return None
+    key = hashlib.sha256(json_bytes)
+    key.update(filter_fingerprint.encode())
+    key.update(get_pipeline_fingerprint().encode())
+    key.update(repr(low_memory).encode())
+    
+    return ''.join(['spectrum/cache/bands_', key.hexdigest(), '.pkl'])
+
+
+def evict_bands_cache(cache_size=CACHE_SIZE):
+    """Removes the least recently used bands
+    objects from spectrum/cache until the cache
+    is no larger than cache_size bytes.
+    
+    """
+    if not os.path.isdir('spectrum/cache'):
+        return
+    entries = []
+    for filename in os.listdir('spectrum/cache'):
+        path = ''.join(['spectrum/cache/', filename])
+        if filename.endswith('.pkl') and os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = 0
+    for _, size, path in sorted(entries, reverse=True):
+        total += size
+        if total > cache_size:
+            os.remove(path)
+
+
 def add_fcutoff_unique_id(bands):
     """Returns the input dataframe
     with the frequency cutoff values applied
@@ -2,6 +2,8 @@ __author__ = "David Northcote, Graeme Fitzpatrick"
 __organisation__ = "The Univeristy of Strathclyde"
 __support__ = "https://github.com/strath-sdr/pynq_spectrum_map"
 
+import heapq
+import numpy as np
 import pandas as pd
 
 from pynq_specmap import plots
@@ -121,13 +123,17 @@ def set_bands_values(bands, key=None, oldvalue=None, \
         newvalue is None:
         raise ValueError( \
         'Please initialise all arguments with a value.')
+    if hasattr(bands[key], 'cat') and \
+        newvalue not in bands[key].cat.categories:
+        bands[key] = bands[key].cat.add_categories([newvalue])
     bands.loc[bands[key] == oldvalue, key] \
     = newvalue
     
     return bands    
 
 
-def merge_bands_threshold(bands, threshold=0, unique=False):
+def merge_bands_threshold(bands, threshold=0, unique=False, \
+                          low_memory=False):
     """Returns a copy of the input dataframe where
     bands have been merged based on their proximity to
     one another.
@@ -135,12 +141,17 @@ def merge_bands_threshold(bands, threshold=0, unique=False):
     Use the threshold argument to modify the distance
     required to merge two bands. Use the unique argument
     to only merge bands with the same unique name that
-    are in proximity to one another.
+    are in proximity to one another. Use the low_memory
+    argument to only copy the traces of the merged bands
+    instead of deep copying the input dataframe.
     
     """
     sectors = get_bands_unique_values(bands, key='s')
     temp_bands = []
-    bands_copy = utilities.deep_copy_bands(bands)
+    if low_memory:
+        bands_copy = bands
+    else:
+        bands_copy = utilities.deep_copy_bands(bands)
     if threshold < 0:
         raise ValueError('Threshold must be more than or equal to 0.')
     for sector in sectors['s']:
@@ -149,6 +160,8 @@ def merge_bands_threshold(bands, threshold=0, unique=False):
         series = bands_copy['s'].values == sector
         sector_bands = bands_copy[series]
         for index, band in sector_bands.iterrows():
+            if low_memory:
+                band['trace'] = dict(band['trace'])
             if band['lf'] < lf:
                 raise RuntimeError(''.join(['Band merge error! Band index', str(index)]))
             else:
@@ -174,6 +187,79 @@ def merge_bands_threshold(bands, threshold=0, unique=False):
     return plots.update_traces(new_bands)                 
 
 
+def find_bands_overlap(bands, threshold=0):
+    """Returns a dataframe listing every pair of
+    bands that overlap one another, both within a
+    sector and across sectors.
+    
+    The bands are sorted by lower frequency internally
+    and swept once, so the input does not need to be
+    sorted. Use the threshold argument to also report
+    bands separated by a gap smaller than threshold,
+    in which case the overlap column is negative.
+    
+    Each row contains the index labels of both bands
+    (a, b), their sectors (s_a, s_b), the overlapping
+    frequency range (lf, uf), the overlap width, and a
+    cluster number shared by all bands in a chain of
+    overlapping allocations.
+    
+    """
+    if threshold < 0:
+        raise ValueError('Threshold must be more than or equal to 0.')
+    lf = bands['lf'].to_numpy(dtype=np.float64)
+    uf = bands['uf'].to_numpy(dtype=np.float64)
+    order = np.argsort(lf, kind='mergesort')
+    active = []
+    pairs_a, pairs_b, pairs_cluster = [], [], []
+    cluster = -1
+    for position in order:
+        while active and (active[0][0] + threshold) <= lf[position]:
+            heapq.heappop(active)
+        if not active:
+            cluster += 1
+        for _, other in active:
+            pairs_a.append(other)
+            pairs_b.append(position)
+            pairs_cluster.append(cluster)
+        heapq.heappush(active, (uf[position], position))
+    pairs_a = np.asarray(pairs_a, dtype=np.int64)
+    pairs_b = np.asarray(pairs_b, dtype=np.int64)
+    overlap_lf = np.maximum(lf[pairs_a], lf[pairs_b])
+    overlap_uf = np.minimum(uf[pairs_a], uf[pairs_b])
+    labels = bands.index.to_numpy()
+    sectors = bands['s'].to_numpy()
+    overlap = pd.DataFrame({'a' : labels[pairs_a],
+                            'b' : labels[pairs_b],
+                            's_a' : sectors[pairs_a],
+                            's_b' : sectors[pairs_b],
+                            'lf' : overlap_lf,
+                            'uf' : overlap_uf,
+                            'overlap' : overlap_uf - overlap_lf,
+                            'cluster' : np.asarray(pairs_cluster, dtype=np.int64)})
+    
+    return overlap
+
+
+def filter_bands_overlap(overlap, cross_sector=None, min_overlap=None):
+    """Returns a filtered dataframe of the overlap
+    table returned by find_bands_overlap.
+    
+    Set cross_sector to True to only select pairs of
+    bands in different sectors, or False to only select
+    pairs within the same sector. min_overlap selects
+    pairs overlapping by at least the given width.
+    
+    """
+    series = np.ones(len(overlap), dtype=bool)
+    if cross_sector is not None:
+        series &= (overlap.s_a.values != overlap.s_b.values) == cross_sector
+    if min_overlap is not None:
+        series &= overlap.overlap.values >= min_overlap
+    
+    return overlap[series]
+
+
 def delete_bands_duplicate(bands): #GF
     """Returns the input dataframe with duplicates
     removed from the lf, uf, s, u, and v columns.
@@ -0,0 +1,196 @@
+__author__ = "David Northcote"
+__organisation__ = "The Univeristy of Strathclyde"
+__support__ = "https://github.com/strath-sdr/pynq_spectrum_map"
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from pynq_specmap import download
+
+
+HISTORY_KEYS = ['lf', 'uf', 's', 'u', 'v']
+HISTORY_OPEN = 99999999999999
+
+
+def get_snapshot_timestamp(filename):
+    """Returns the timestamp of a spectrum
+    download as an integer in the format
+    YYYYMMDDHHMMSS.
+    
+    """
+    filename_text = filename.split('_')
+    d = int(filename_text[2])
+    t = int(filename_text[3].split('.')[0])
+    
+    return d*1000000 + t
+
+
+def initialise_bands_history():
+    """Returns an empty spectrum history object.
+    
+    The snapshots dataframe lists each spectrum download
+    in the history. The bands dataframe holds each unique
+    band once for every interval it was allocated, from
+    the valid_from timestamp to the valid_to timestamp.
+    Bands that are still allocated in the latest snapshot
+    have a valid_to timestamp of HISTORY_OPEN.
+    
+    """
+    snapshots = pd.DataFrame({'timestamp' : pd.Series(dtype=np.int64),
+                              'filename' : pd.Series(dtype=object),
+                              'count' : pd.Series(dtype=np.int64)})
+    bands = pd.DataFrame({'lf' : pd.Series(dtype=np.float64),
+                          'uf' : pd.Series(dtype=np.float64),
+                          's' : pd.Series(dtype=object),
+                          'u' : pd.Series(dtype=object),
+                          'v' : pd.Series(dtype=object),
+                          'valid_from' : pd.Series(dtype=np.int64),
+                          'valid_to' : pd.Series(dtype=np.int64)})
+    
+    return {'snapshots' : snapshots, 'bands' : bands}
+
+
+def append_bands_history(history, bands, timestamp, filename=''):
+    """Returns the history object with the given
+    bands appended as a new snapshot.
+    
+    Bands already allocated in the history are not
+    duplicated. Allocated bands missing from the new
+    snapshot have their valid_to timestamp set, and new
+    bands are added with a valid_from timestamp. The
+    timestamp must be later than the latest snapshot.
+    
+    """
+    snapshots = history['snapshots']
+    if len(snapshots) and (timestamp <= snapshots.timestamp.max()):
+        raise ValueError(''.join(['Snapshot ', str(timestamp),
+                                  ' is not later than the latest snapshot.']))
+    bands = bands.reindex(columns=HISTORY_KEYS).drop_duplicates()
+    history_bands = history['bands']
+    series = history_bands.valid_to.values == HISTORY_OPEN
+    merged = history_bands.loc[series, HISTORY_KEYS].reset_index().merge(
+        bands, on=HISTORY_KEYS, how='outer', indicator=True)
+    closed = merged.loc[merged._merge == 'left_only', 'index'].astype(np.int64)
+    history_bands.loc[closed.values, 'valid_to'] = timestamp
+    added = merged.loc[merged._merge == 'right_only', HISTORY_KEYS].assign(
+        valid_from=timestamp, valid_to=HISTORY_OPEN)
+    history['bands'] = pd.concat([history_bands, added], ignore_index=True)
+    history['snapshots'] = pd.concat([snapshots, pd.DataFrame({
+        'timestamp' : [timestamp],
+        'filename' : [filename],
+        'count' : [len(bands)]})], ignore_index=True)
+    
+    return history
+
+
+def get_history_filename(region='uk'):
+    """Returns the path of the spectrum history
+    object for the given region.
+    
+    """
+    return ''.join(['spectrum/history_', region, '.pkl'])
+
+
+def update_bands_history(region='uk', date=None, time=None):
+    """Updates the spectrum history object of the
+    given region with previously downloaded spectrum
+    json files that are not yet in the history. The
+    date and time arguments filter the json files in
+    the same way as get_bands_filename.
+    
+    Only new json files are loaded, unless a new file
+    is older than the latest snapshot in the history. In
+    that case the history is rebuilt from every snapshot
+    in timestamp order. Returns the updated history object.
+    
+    """
+    if os.path.isfile(get_history_filename(region)):
+        history = retrieve_bands_history(region)
+    else:
+        history = initialise_bands_history()
+    snapshots = history['snapshots']
+    ingested = set(snapshots.filename)
+    filenames = [filename for filename in
+                 download.get_bands_filename(region, date, time)
+                 if filename not in ingested]
+    if not filenames:
+        return history
+    if len(snapshots) and (min(get_snapshot_timestamp(filename)
+                               for filename in filenames) \
+                           <= snapshots.timestamp.max()):
+        missing = [filename for filename in snapshots.filename
+                   if not os.path.isfile(''.join(['spectrum/', filename]))]
+        if missing:
+            raise RuntimeError(''.join(['Cannot rebuild bands history, file named ',
+                                        missing[0], ' does not exist.']))
+        filenames = list(snapshots.filename) + filenames
+        history = initialise_bands_history()
+    for filename in sorted(filenames, key=get_snapshot_timestamp):
+        with open(''.join(['spectrum/', filename])) as json_file:
+            bands = pd.DataFrame(json.load(json_file)['bands'])
+        history = append_bands_history(history, bands,
+                                       get_snapshot_timestamp(filename),
+                                       filename)
+    pd.to_pickle(history, get_history_filename(region))
+    
+    return history
+
+
+def retrieve_bands_history(region='uk'):
+    """Retrieves the spectrum history object of
+    the given region. Use update_bands_history to
+    add new spectrum downloads to the history.
+    
+    """
+    if os.path.isfile(get_history_filename(region)):
+        history = pd.read_pickle(get_history_filename(region))
+    else:
+        raise RuntimeError('No bands history exists.')
+    
+    return history
+
+
+def get_bands_at(history, frequency, date, time=240000):
+    """Returns a dataframe of the bands allocated
+    at the given frequency on the given date and
+    time. date and time use the YYYYMMDD and HHMMSS
+    formats of get_bands_filename.
+    
+    """
+    timestamp = date*1000000 + time
+    bands = history['bands']
+    series = (bands.lf.values <= frequency) & \
+             (bands.uf.values >= frequency) & \
+             (bands.valid_from.values <= timestamp) & \
+             (bands.valid_to.values > timestamp)
+    
+    return bands[series]
+
+
+def get_bands_changes(history, lf, uf, date_start, date_end, \
+                      time_start=0, time_end=240000):
+    """Returns a dataframe of the bands in the given
+    lower and upper frequency range that were added or
+    removed after the start date and time, up to and
+    including the end date and time.
+    
+    The change column is either 'added' or 'removed'.
+    
+    """
+    timestamp_start = date_start*1000000 + time_start
+    timestamp_end = date_end*1000000 + time_end
+    bands = history['bands']
+    series = (bands.lf.values <= uf) & \
+             (bands.uf.values >= lf)
+    added = series & \
+            (bands.valid_from.values > timestamp_start) & \
+            (bands.valid_from.values <= timestamp_end)
+    removed = series & \
+              (bands.valid_to.values > timestamp_start) & \
+              (bands.valid_to.values <= timestamp_end)
+    changes = pd.concat([bands[added].assign(change='added'),
+                         bands[removed].assign(change='removed')])
+    
+    return changes
@@ -7,6 +7,7 @@ import pandas as pd
 import copy
 
 from pynq_specmap import filters
+from pynq_specmap import utilities
 
 import plotly.io as pio
 pio.renderers.default ='jupyterlab'
@@ -82,13 +83,24 @@ def initialise_plot(layout={}, template='plotly'):
     return plot
 
 
-def initialise_traces_opt(bands=pd.DataFrame()):
+def initialise_traces_opt(bands=pd.DataFrame(), low_memory=False, \
+                          memory_budget=None):
     """Initialise each band with plotly
     scatter objects. Adds a trace column
     to the dataframe containing go.Scatter
     json string for adding to a plot.
     
+    Use the low_memory argument to share the
+    unchanged parts of the trace json between
+    bands instead of copying them for each band.
+    Use the memory_budget argument to raise a
+    MemoryError as soon as the bands and traces
+    use more than the given number of bytes.
+    
     """
+    if memory_budget is not None:
+        memory_usage = utilities.get_bands_memory_usage(bands)
+        seen = set()
     traces = []
     trace = go.Scatter(
         x=[0, 0, 0, 0],
@@ -106,7 +118,10 @@ def initialise_traces_opt(bands=pd.DataFrame()):
     )
     trace_json = trace.to_plotly_json()
     for index, band in bands.iterrows():
-        temp_json = copy.deepcopy(trace_json)
+        if low_memory:
+            temp_json = dict(trace_json)
+        else:
+            temp_json = copy.deepcopy(trace_json)
         temp_json.update({'x' : [band['lf'], band['lf'], band['uf'], band['uf']],
                           'name' : ''.join(['<b>',band['s'],'</b><br>',band['u']]),
                           'fillcolor' : COLOURS[band['s']],
@@ -117,6 +132,9 @@ def initialise_traces_opt(bands=pd.DataFrame()):
                           'ids' : [band['s']],
                          })
         traces.append(temp_json)
+        if memory_budget is not None:
+            memory_usage += utilities.get_object_size(temp_json, seen) + 8
+            utilities.check_memory_budget(memory_usage, memory_budget)
     bands['trace'] = traces
     
     return bands
@@ -207,3 +225,42 @@ def reset_overlay_trace(plot):
                           'color' : 'rgba(0, 0, 0, 0)'}
             trace.name=''
             trace.ids=['Overlay Trace']
+            
+            
+def add_spectrum_trace(plot):
+    """Adds the spectrum trace, which displays
+    live FFT magnitudes over the spectrum bands.
+    Returns the trace added to the plot so that
+    it can be updated without searching plot.data.
+    
+    """
+    spectrum_trace = go.Scattergl(
+        x=[],
+        y=[],
+        mode='lines',
+        line={
+            'width' : 1,
+            'color' : 'rgb(0, 0, 0)'},
+        name='',
+        ids=['Spectrum Trace'],
+        hovertemplate="%{text}<br>%{y:.1f} dB<extra></extra>",
+    )
+    
+    plot.add_trace(spectrum_trace)
+    
+    return plot.data[-1]
+
+
+def update_spectrum_trace(plot, trace, x=None, y=None, text=None):
+    """Updates the spectrum trace with new
+    frequency, magnitude, and hover text values.
+    Only the arguments given are sent to the client.
+    
+    """
+    with plot.batch_update():
+        if x is not None:
+            trace.x = x
+        if text is not None:
+            trace.text = text
+        if y is not None:
+            trace.y = y
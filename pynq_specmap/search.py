@@ -0,0 +1,254 @@
+__author__ = "David Northcote"
+__organisation__ = "The Univeristy of Strathclyde"
+__support__ = "https://github.com/strath-sdr/pynq_spectrum_map"
+
+import bisect
+import re
+import sys
+import zlib
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[.\-/][a-z0-9]+)*')
+TOKEN_SEPARATORS = re.compile(r'[.\-/]')
+FUZZY_LENGTH = 4
+PREFIX_LENGTH = 2
+
+
+def tokenise_band_text(text):
+    """Returns the set of lower case search tokens
+    in the given text. Compound tokens such as gsm-r
+    and 2.4 are kept whole, and their parts are
+    added as tokens as well.
+    
+    """
+    tokens = set()
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.add(token)
+        tokens.update(TOKEN_SEPARATORS.split(token))
+    
+    return tokens
+
+
+def get_token_deletes(token):
+    """Returns the set of strings formed by
+    deleting one character from the given token.
+    
+    """
+    return {token[:i] + token[i+1:] for i in range(len(token))}
+
+
+def get_token_prefixes(tokens):
+    """Returns the set of prefixes of the given
+    tokens up to PREFIX_LENGTH characters long.
+    
+    """
+    return {token[:length] for token in tokens
+            for length in range(1, min(len(token), PREFIX_LENGTH) + 1)}
+
+
+def is_one_edit(term, token):
+    """Returns True if the token is within one
+    insertion, deletion, substitution, or adjacent
+    transposition of the term.
+    
+    """
+    if term == token:
+        return True
+    if abs(len(term) - len(token)) > 1:
+        return False
+    if len(term) != len(token):
+        shorter, longer = sorted([term, token], key=len)
+        return shorter in get_token_deletes(longer)
+    differences = [i for i in range(len(term)) if term[i] != token[i]]
+    if len(differences) == 1:
+        return True
+    
+    return len(differences) == 2 and \
+           (differences[1] == differences[0] + 1) and \
+           (term[differences[0]] == token[differences[1]]) and \
+           (term[differences[1]] == token[differences[0]])
+
+
+def initialise_search_index(bands, keys=['u', 's', 'v']):
+    """Returns a search index over the tokens in
+    the given columns of the bands dataframe.
+    
+    The index is a dictionary holding a hash and the
+    tokens of each band, an inverted index from each token
+    to the band index labels containing it, the band index
+    labels for each short prefix, a sorted vocabulary for
+    prefix search, and sorted arrays of one character
+    deletion hashes for fuzzy search.
+    
+    """
+    index = {'keys' : keys,
+             'documents' : {},
+             'postings' : {},
+             'prefixes' : {},
+             'vocabulary' : [],
+             'fuzzy_keys' : np.empty(0, dtype=np.uint32),
+             'fuzzy_tokens' : np.empty(0, dtype=np.int32)}
+    
+    return update_search_index(index, bands)
+
+
+def _collect_search_changes(changes, label, old_tokens, new_tokens):
+    """Records the postings and prefixes that the
+    band label is added to or removed from when its
+    tokens change from old_tokens to new_tokens.
+    
+    """
+    old_tokens, new_tokens = set(old_tokens), set(new_tokens)
+    old_prefixes = get_token_prefixes(old_tokens)
+    new_prefixes = get_token_prefixes(new_tokens)
+    for token in old_tokens - new_tokens:
+        changes['postings_removed'].setdefault(token, set()).add(label)
+    for token in new_tokens - old_tokens:
+        changes['postings_added'].setdefault(token, []).append(label)
+    for prefix in old_prefixes - new_prefixes:
+        changes['prefixes_removed'].setdefault(prefix, set()).add(label)
+    for prefix in new_prefixes - old_prefixes:
+        changes['prefixes_added'].setdefault(prefix, []).append(label)
+
+
+def _apply_search_changes(mapping, added, removed):
+    """Applies the recorded changes to a mapping of
+    keys to tuples of band labels. Returns True if
+    any keys were added to or removed from the mapping.
+    
+    """
+    keys_changed = False
+    for key in set(added) | set(removed):
+        labels = mapping.get(key, ())
+        if key in removed:
+            labels = [label for label in labels if label not in removed[key]]
+        labels = tuple(labels) + tuple(added.get(key, ()))
+        if labels:
+            keys_changed = keys_changed or (key not in mapping)
+            mapping[key] = labels
+        elif key in mapping:
+            del mapping[key]
+            keys_changed = True
+    
+    return keys_changed
+
+
+def _build_fuzzy_lookup(index):
+    """Rebuilds the sorted vocabulary and the sorted
+    arrays of token and deletion hashes used for fuzzy
+    search from the postings of the search index.
+    
+    """
+    vocabulary = sorted(index['postings'])
+    fuzzy_keys, fuzzy_tokens = [], []
+    for position, token in enumerate(vocabulary):
+        if len(token) < FUZZY_LENGTH - 1:
+            continue
+        variants = {token}
+        if len(token) >= FUZZY_LENGTH:
+            variants.update(get_token_deletes(token))
+        for variant in variants:
+            fuzzy_keys.append(zlib.crc32(variant.encode()))
+            fuzzy_tokens.append(position)
+    fuzzy_keys = np.asarray(fuzzy_keys, dtype=np.uint32)
+    order = np.argsort(fuzzy_keys, kind='mergesort')
+    index['vocabulary'] = vocabulary
+    index['fuzzy_keys'] = fuzzy_keys[order]
+    index['fuzzy_tokens'] = np.asarray(fuzzy_tokens, dtype=np.int32)[order]
+
+
+def update_search_index(index, bands):
+    """Returns the search index updated to match
+    the given bands dataframe.
+    
+    Only bands that have been added, removed, or
+    changed since the index was last updated are
+    tokenised and updated in the index. The fuzzy
+    search arrays are rebuilt only if tokens were
+    added to or removed from the vocabulary.
+    
+    """
+    documents = index['documents']
+    changes = {'postings_added' : {}, 'postings_removed' : {},
+               'prefixes_added' : {}, 'prefixes_removed' : {}}
+    columns = [bands[key].astype(object).fillna('').astype(str) \
+               for key in index['keys']]
+    labels = set()
+    for label, *values in zip(bands.index, *columns):
+        labels.add(label)
+        text = ' '.join(values)
+        document = documents.get(label)
+        if (document is not None) and (document[0] == hash(text)):
+            continue
+        tokens = tuple(sys.intern(token) for token in tokenise_band_text(text))
+        _collect_search_changes(changes, label,
+                                () if document is None else document[1], tokens)
+        documents[label] = (hash(text), tokens)
+    for label in set(documents) - labels:
+        _collect_search_changes(changes, label, documents.pop(label)[1], ())
+    _apply_search_changes(index['prefixes'], changes['prefixes_added'],
+                          changes['prefixes_removed'])
+    if _apply_search_changes(index['postings'], changes['postings_added'],
+                             changes['postings_removed']):
+        _build_fuzzy_lookup(index)
+    
+    return index
+
+
+def get_fuzzy_tokens(index, term):
+    """Returns the set of tokens in the search
+    index within one insertion, deletion, substitution,
+    or adjacent transposition of the given term.
+    
+    """
+    vocabulary = index['vocabulary']
+    fuzzy_keys = index['fuzzy_keys']
+    variants = get_token_deletes(term) | {term}
+    query_keys = np.asarray([zlib.crc32(variant.encode()) for variant in variants],
+                            dtype=np.uint32)
+    starts = np.searchsorted(fuzzy_keys, query_keys, side='left')
+    stops = np.searchsorted(fuzzy_keys, query_keys, side='right')
+    tokens = set()
+    for start, stop in zip(starts, stops):
+        for position in index['fuzzy_tokens'][start:stop].tolist():
+            if is_one_edit(term, vocabulary[position]):
+                tokens.add(vocabulary[position])
+    
+    return tokens
+
+
+def search_bands(index, query, fuzzy=True):
+    """Returns a sorted list of the index labels of
+    bands matching every term in the query.
+    
+    Each term matches tokens it is a prefix of. Terms
+    of up to PREFIX_LENGTH characters are looked up in
+    the precomputed prefixes. If fuzzy is True, terms of
+    at least FUZZY_LENGTH characters also match tokens
+    one edit away.
+    
+    """
+    postings = index['postings']
+    vocabulary = index['vocabulary']
+    result = None
+    for term in TOKEN_PATTERN.findall(query.lower()):
+        if len(term) <= PREFIX_LENGTH:
+            matches = set(index['prefixes'].get(term, ()))
+        else:
+            matches = set()
+            position = bisect.bisect_left(vocabulary, term)
+            while (position < len(vocabulary)) and \
+            vocabulary[position].startswith(term):
+                matches.update(postings[vocabulary[position]])
+                position += 1
+            if fuzzy and (len(term) >= FUZZY_LENGTH):
+                for token in get_fuzzy_tokens(index, term):
+                    matches.update(postings[token])
+        result = matches if result is None else (result & matches)
+        if not result:
+            break
+    if result is None:
+        return []
+    
+    return sorted(result)
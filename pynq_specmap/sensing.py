@@ -0,0 +1,209 @@
+__author__ = "David Northcote"
+__organisation__ = "The Univeristy of Strathclyde"
+__support__ = "https://github.com/strath-sdr/pynq_spectrum_map"
+
+import time
+import numpy as np
+
+from pynq_specmap import plots
+
+
+def get_bin_frequencies(fc, fs, n=8192):
+    """Returns the centre frequency of each
+    bin of an n point FFT, ordered from the lowest
+    to the highest frequency (fftshifted), given
+    the centre frequency and sample rate.
+    
+    """
+    return fc - fs/2 + np.arange(n)*(fs/n)
+
+
+def generate_spectrum_frame(fc, fs, n=8192, signals=[], \
+                            noise_floor=-100, rng=None):
+    """Returns a synthetic array of FFT magnitudes
+    in dB so that the spectrum overlay can be used
+    without any hardware.
+    
+    signals is a list of (frequency, magnitude) or
+    (frequency, magnitude, bandwidth) tuples added
+    on top of complex gaussian noise at noise_floor.
+    Use the rng argument to pass a seeded numpy
+    random generator for repeatable frames.
+    
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    noise = rng.standard_normal(n)**2 + rng.standard_normal(n)**2
+    power = noise*(10**(noise_floor/10)/2)
+    resolution = fs/n
+    lowest = fc - fs/2
+    for signal in signals:
+        frequency, magnitude = signal[0], signal[1]
+        bandwidth = signal[2] if len(signal) > 2 else resolution
+        start = max(int(np.floor((frequency - bandwidth/2 - lowest)/resolution)), 0)
+        stop = min(int(np.ceil((frequency + bandwidth/2 - lowest)/resolution)), n)
+        if start < stop:
+            power[start:stop] += 10**(magnitude/10)
+    
+    return 10*np.log10(power)
+
+
+def compute_bin_band_lut(bands, fc, fs, n=8192):
+    """Returns a dictionary containing a lookup
+    table from FFT bin to band for the given centre
+    frequency, sample rate, and FFT size.
+    
+    The lut key holds the position of the band in the
+    input dataframe for each bin, or -1 if the bin is
+    unallocated. Where bands overlap, the narrowest
+    band is used. The remaining keys group the bins
+    by band so that statistics can be computed for
+    every band at once using compute_band_statistics.
+    
+    """
+    freqs = get_bin_frequencies(fc, fs, n)
+    lut = np.full(n, -1, dtype=np.int64)
+    lf = bands['lf'].to_numpy(dtype=np.float64)
+    uf = bands['uf'].to_numpy(dtype=np.float64)
+    start = np.searchsorted(freqs, lf, side='left')
+    stop = np.searchsorted(freqs, uf, side='left')
+    visible = np.flatnonzero(start < stop)
+    visible = visible[np.argsort(lf[visible] - uf[visible], kind='mergesort')]
+    for position in visible:
+        lut[start[position]:stop[position]] = position
+    allocated = np.flatnonzero(lut >= 0)
+    order = allocated[np.argsort(lut[allocated], kind='mergesort')]
+    positions, starts, counts = np.unique(lut[order], return_index=True,
+                                          return_counts=True)
+    
+    return {'fc' : fc,
+            'fs' : fs,
+            'n' : n,
+            'freqs' : freqs,
+            'lut' : lut,
+            'order' : order,
+            'positions' : positions,
+            'index' : bands.index.to_numpy()[positions],
+            'starts' : starts,
+            'counts' : counts}
+
+
+def compute_band_statistics(frame, lut, threshold=-80):
+    """Returns a dictionary of per band statistics
+    for a frame of FFT magnitudes in dB using a lookup
+    table from compute_bin_band_lut.
+    
+    The index key holds the dataframe index of each band
+    in view. The peak and mean keys hold the peak and
+    mean power in dB. The occupancy key holds the
+    fraction of bins in the band above threshold.
+    
+    """
+    frame = np.asarray(frame, dtype=np.float64)
+    if frame.shape != (lut['n'],):
+        raise ValueError(''.join(['Frame must contain ', str(lut['n']), ' bins.']))
+    if len(lut['starts']) == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return {'index' : lut['index'], 'peak' : empty,
+                'mean' : empty, 'occupancy' : empty}
+    values = frame[lut['order']]
+    starts = lut['starts']
+    peak = np.maximum.reduceat(values, starts)
+    power = np.add.reduceat(np.power(10, values/10), starts)/lut['counts']
+    occupied = np.add.reduceat((values > threshold).astype(np.int64), starts)
+    
+    return {'index' : lut['index'],
+            'peak' : peak,
+            'mean' : 10*np.log10(power),
+            'occupancy' : occupied/lut['counts']}
+
+
+def get_bin_band_text(bands, lut):
+    """Returns an array containing the hover text
+    of each FFT bin, which names the band the bin
+    is allocated to.
+    
+    """
+    names = ('<b>' + bands['s'].astype(str) + '</b><br>' \
+             + bands['u'].astype(str)).to_numpy(dtype=object)
+    text = np.full(lut['n'], 'Unallocated', dtype=object)
+    allocated = lut['lut'] >= 0
+    text[allocated] = names[lut['lut'][allocated]]
+    
+    return text
+
+
+def initialise_spectrum_overlay(plot, bands, fc, fs, n=8192, \
+                                threshold=-80, interval=0.1):
+    """Returns a spectrum overlay dictionary, which
+    maps live FFT frames onto the given bands and
+    displays them on the plot using one spectrum trace.
+    
+    threshold is the magnitude in dB above which a bin
+    is occupied. interval is the minimum time in seconds
+    between plot updates, so frames can be pushed faster
+    than the plot can be redrawn.
+    
+    """
+    lut = compute_bin_band_lut(bands, fc, fs, n)
+    trace = plots.add_spectrum_trace(plot)
+    plots.update_spectrum_trace(plot, trace, x=lut['freqs'],
+                                y=np.full(n, np.nan),
+                                text=get_bin_band_text(bands, lut))
+    
+    return {'plot' : plot,
+            'trace' : trace,
+            'bands' : bands,
+            'lut' : lut,
+            'threshold' : threshold,
+            'interval' : interval,
+            'updated' : 0.0,
+            'pending' : None,
+            'statistics' : None}
+
+
+def update_spectrum_overlay(overlay, frame, fc=None, fs=None, flush=False):
+    """Returns the per band statistics of a new
+    frame of FFT magnitudes in dB and updates the
+    spectrum trace if the overlay interval has passed.
+    
+    Frames that arrive within the interval are kept as
+    pending and drawn by the next update. Set flush to
+    True, or call flush_spectrum_overlay, to draw the
+    latest frame immediately, for example when a stream
+    stops. If fc or fs differ from the current lookup
+    table, the lookup table is recomputed and the trace
+    frequency axis is updated.
+    
+    """
+    lut = overlay['lut']
+    fc = lut['fc'] if fc is None else fc
+    fs = lut['fs'] if fs is None else fs
+    n = len(frame)
+    if (fc != lut['fc']) or (fs != lut['fs']) or (n != lut['n']):
+        lut = compute_bin_band_lut(overlay['bands'], fc, fs, n)
+        overlay['lut'] = lut
+        plots.update_spectrum_trace(overlay['plot'], overlay['trace'],
+                                    x=lut['freqs'],
+                                    text=get_bin_band_text(overlay['bands'], lut))
+        overlay['updated'] = 0.0
+    statistics = compute_band_statistics(frame, lut, overlay['threshold'])
+    overlay['statistics'] = statistics
+    overlay['pending'] = frame
+    if flush or ((time.monotonic() - overlay['updated']) >= overlay['interval']):
+        flush_spectrum_overlay(overlay)
+    
+    return statistics
+
+
+def flush_spectrum_overlay(overlay):
+    """Draws the latest pending frame of the
+    spectrum overlay on the spectrum trace, if a
+    frame has not been drawn yet.
+    
+    """
+    if overlay['pending'] is not None:
+        plots.update_spectrum_trace(overlay['plot'], overlay['trace'],
+                                    y=overlay['pending'])
+        overlay['pending'] = None
+        overlay['updated'] = time.monotonic()
@@ -3,6 +3,8 @@ __organisation__ = "The Univeristy of Strathclyde"
 __support__ = "https://github.com/strath-sdr/pynq_spectrum_map"
 
 import copy
+import resource
+import sys
 
 
 def generate_band_cutoff_string(band):
@@ -56,3 +58,77 @@ def deep_copy_bands(bands):
     bands_copy['trace'] = copy.deepcopy(trace_list)
     
     return bands_copy
+
+
+def get_object_size(obj, seen=None):
+    """Returns the size in bytes of the given
+    object and the dictionaries, lists, tuples, sets,
+    and strings it references.
+    
+    Use the seen argument to pass a set of object ids
+    that have already been counted, so that objects
+    shared between calls are only counted once.
+    
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    
+    return size
+
+
+def get_bands_memory_usage(bands, seen=None):
+    """Returns the memory used by the bands
+    dataframe in bytes, including the strings and
+    nested trace data it holds. Trace data shared
+    between bands is only counted once.
+    
+    Use the seen argument to pass a set of object ids
+    that have already been counted, for example to size
+    two dataframes that share trace data.
+    
+    """
+    memory_usage = bands.index.memory_usage(deep=True)
+    if seen is None:
+        seen = set()
+    for column in bands:
+        if column == 'trace':
+            memory_usage += bands[column].memory_usage(index=False, deep=False)
+            for trace in bands[column]:
+                memory_usage += get_object_size(trace, seen)
+        else:
+            memory_usage += bands[column].memory_usage(index=False, deep=True)
+    
+    return int(memory_usage)
+
+
+def check_memory_budget(memory_usage, memory_budget=None):
+    """Raises a MemoryError if the memory usage
+    in bytes exceeds the memory budget in bytes.
+    
+    """
+    if (memory_budget is not None) and (memory_usage > memory_budget):
+        raise MemoryError(''.join(['Bands object uses ', str(memory_usage),
+                                   ' bytes, exceeding the memory budget of ',
+                                   str(memory_budget), ' bytes.']))
+
+
+def get_peak_rss():
+    """Returns the peak resident set size of
+    the current process in bytes. Use this to
+    report the memory used when benchmarking.
+    
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024